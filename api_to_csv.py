@@ -1,7 +1,15 @@
 import os
+import csv
+import orjson
 import requests
+import numpy as np
 import pandas as pd
+from requests.adapters import HTTPAdapter
+from urllib3.util import make_headers
+from urllib3.util.retry import Retry
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -9,6 +17,29 @@ load_dotenv()
 API = "https://api.data.gov/ed/collegescorecard/v1/schools"
 API_KEY = os.getenv("SCORECARD_API_KEY")
 
+# Concurrent requests for the per-year fallback in fetch_years
+MAX_WORKERS = 8
+
+# Shared session so every request reuses the same pooled HTTPS connection
+# instead of paying a fresh TCP + TLS handshake per call
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=1,
+    pool_maxsize=MAX_WORKERS,
+    # raise_on_status=False hands back the last response once retries run
+    # out, so raise_for_status reports its real status code
+    max_retries=Retry(
+        total=3,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        raise_on_status=False,
+    ),
+))
+
+# Responses are mostly repeated field names and compress well, so advertise
+# every encoding urllib3 can decode here (gzip, deflate, and br via brotli)
+SESSION.headers.update(make_headers(accept_encoding=True))
+
 # DOE Unit Identification Numbers
 UNITIDS = [164748, 192110, 167057, 192712, 211893]
 YEARS = range(2012, 2022 + 1)
@@ -35,112 +66,293 @@ FIELD_MAP = {
     "avg_net_price": "cost.avg_net_price.private",
 }
 
+# Long format output columns: one row per school per year
+COLUMNS = ["institution", "unitid", "year", *FIELD_MAP.keys()]
+
+# dtypes for the long format frame; enrollment is a nullable integer count
+# and the few distinct institution names are stored as category codes
+DTYPES = {
+    "institution": "category",
+    "unitid": "int64",
+    "year": "int32",
+    "enrollment_total": "Int64",
+    "admission_rate": "float64",
+    "retention_rate_ft": "float64",
+    "grad_rate_150": "float64",
+    "tuition_fees": "float64",
+    "avg_net_price": "float64",
+}
+
+# Metrics reported as rates, normalized to percentages
+PERCENT_FIELDS = ("admission_rate", "retention_rate_ft", "grad_rate_150")
+
 
 # Convert decimal values (0-1) to percentages (0-100) and round to 2 decimal places
-# If values are already in percentage format (>1 or <0), just round them
+# Values already in percentage format (>1 or <0) are just rounded
 def normalize_percentages(df: pd.DataFrame, percentage_fields=None) -> pd.DataFrame:
     if percentage_fields is None:
-        percentage_fields = ["admission_rate", "retention_rate_ft", "grad_rate_150"]
+        percentage_fields = PERCENT_FIELDS
 
     # c = column
-    # s = series
-    out = df.copy()
-    for c in percentage_fields:
-        if c in out.columns:
-            s = pd.to_numeric(out[c], errors="coerce")
-            if s.notna().any():
-                valid = s[s.notna()]
-                if len(valid) > 0 and valid.max() <= 1.0 and valid.min() >= 0:
-                    # Convert decimals to percentages
-                    out[c] = (s * 100).round(2)
-                else:
-                    # Already in percentage format, just round
-                    out[c] = s.round(2)
+    # m = matrix
+    # Shallow copy: untouched columns are shared with the input and each
+    # percentage column is replaced by a new array, so the input is never modified
+    out = df.copy(deep=False)
+    present = [c for c in percentage_fields if c in out.columns]
+    if not present:
+        return out
+
+    # One float64 block with a row per column (pd.NA from nullable dtypes
+    # becomes NaN), so the mask, scale and round each run once over every
+    # column instead of once per column
+    m = np.empty((len(present), len(out)))
+    for i, c in enumerate(present):
+        m[i] = to_float_array(out[c])
+
+    normalize_percentages_arr(m)
+    for i, c in enumerate(present):
+        out[c] = m[i]
     return out
 
 
+# Column values as float64, with missing or non-numeric values as NaN
+# Numeric columns (including nullable ones) skip pd.to_numeric entirely
+def to_float_array(s: pd.Series) -> np.ndarray:
+    if s.dtype.kind not in "fiub":
+        s = pd.to_numeric(s, errors="coerce")
+    return s.to_numpy(dtype=float, na_value=np.nan)
+
+
+# Array counterpart to normalize_percentages: applies the same rule to a
+# float64 array of rates, in place, with no pandas overhead
+# NaN fails both comparisons and passes through untouched
+def normalize_percentages_arr(arr: np.ndarray) -> np.ndarray:
+    np.multiply(arr, 100.0, out=arr, where=(arr >= 0) & (arr <= 1.0))
+    return np.round(arr, 2, out=arr)
+
+
+# Row-based counterpart to normalize_percentages for the CSV pipeline
+# Converts each value in place using the same rule, None stays None and
+# non-numeric values become None (as pd.to_numeric(errors="coerce") would)
+def normalize_row_percentages(rows, percentage_fields=None):
+    if percentage_fields is None:
+        percentage_fields = PERCENT_FIELDS
+
+    for row in rows:
+        for c in percentage_fields:
+            v = row.get(c)
+            if v is None:
+                continue
+            try:
+                v = float(v)
+            except (TypeError, ValueError):
+                row[c] = None
+                continue
+            row[c] = round(v * 100.0, 2) if 0 <= v <= 1.0 else round(v, 2)
+    return rows
+
+
+# Coerce each row's metric values in place the way rows_to_frame does, so the
+# CSV holds the same data as the returned DataFrame: non-numeric values
+# become None and a fractional enrollment is rounded to a whole count
+def coerce_row_metrics(rows):
+    for row in rows:
+        for metric in FIELD_MAP:
+            v = row.get(metric)
+            if v is None or isinstance(v, (int, float)):
+                continue
+            try:
+                row[metric] = float(v)
+            except (TypeError, ValueError):
+                row[metric] = None
+
+        enrollment = row.get("enrollment_total")
+        if isinstance(enrollment, float):
+            row["enrollment_total"] = round(enrollment)
+    return rows
+
+
 # Build a filename with year range and timestamp
 # Accepts optional datetime for testing
 def build_filename(years, now=None) -> str:
     if now is None:
         now = datetime.now()
-    year_range = f"{min(years)}_{max(years)}"
+    # A range's endpoints are known without scanning it
+    if isinstance(years, range):
+        first, last = min(years[0], years[-1]), max(years[0], years[-1])
+    else:
+        first, last = min(years), max(years)
+    year_range = f"{first}_{last}"
     timestamp = now.strftime("%Y%m%d")
     return f"music_school_data_{year_range}_{timestamp}.csv"
 
 
-def fetch_year(institution_ids, year):
-    fields = ["id", "school.name"]
-    fields += [f"{year}.{f}" for f in FIELD_MAP.values()]
+# (metric, year-prefixed API field) pairs for a year
+# Cached so the field strings are only built once per year
+@lru_cache(maxsize=None)
+def year_fields(year):
+    return tuple((metric, f"{year}.{suffix}") for metric, suffix in FIELD_MAP.items())
+
+
+# The same fields as one comma-joined string for the fields= parameter
+@lru_cache(maxsize=None)
+def joined_year_fields(year):
+    return ",".join(field for _, field in year_fields(year))
+
+
+# Failures worth retrying one year at a time: timeouts, connection errors
+# and 5xx responses. Other client errors (bad API key, rate limiting) would
+# fail the same way for every year
+def is_transient_error(ex):
+    if isinstance(ex, (requests.exceptions.Timeout, requests.exceptions.ConnectionError)):
+        return True
+    response = getattr(ex, "response", None)
+    return response is not None and response.status_code >= 500
+
+
+# Fetch every requested year for all schools in a single API call
+# Year-prefixed fields for all years are requested at once, then pivoted
+# into long format rows (one dict per school per year)
+def fetch_rows(institution_ids, years):
+    years = sorted(years)
+    wanted = frozenset(institution_ids)
     params = {
         "api_key": API_KEY,
         "id__in": ",".join(map(str, institution_ids)),
-        "fields": ",".join(fields),
+        "fields": ",".join(["id", "school.name", *map(joined_year_fields, years)]),
         "per_page": 100,
     }
     
     # res = response
     # ex = exception
     try:
-        res = requests.get(API, params=params, timeout=30)
+        res = SESSION.get(API, params=params, timeout=30)
         res.raise_for_status()
-        js = res.json()
+        js = orjson.loads(res.content)
     except requests.exceptions.RequestException as ex:
-        print(f"Error fetching data for year {year}: {ex}")
-        return pd.DataFrame()
+        print(f"Error fetching data for years {years}: {ex}")
+        return fetch_years(institution_ids, years) if len(years) > 1 and is_transient_error(ex) else []
     except ValueError as ex:
-        print(f"Error parsing JSON response for year {year}: {ex}")
-        return pd.DataFrame()
+        print(f"Error parsing JSON response for years {years}: {ex}")
+        return fetch_years(institution_ids, years) if len(years) > 1 else []
     
     results = js.get("results", [])
     if not results:
-        print(f"Warning: No data returned for year {year}")
-        return pd.DataFrame()
+        print(f"Warning: No data returned for years {years}")
+        return []
     
-    rows = []
+    schools = []
     for item in results:
+        # Skips results with no id and any school that wasn't requested
         row_id = item.get("id")
-        if not row_id:
+        if row_id not in wanted:
             continue
-            
-        row = {
-            "institution": NAME_MAP.get(row_id, item.get("school.name", "Unknown")),
-            "unitid": row_id,
-            "year": year,
-        }
-
-        for metric, field_suffix in FIELD_MAP.items():
-            row[metric] = item.get(f"{year}.{field_suffix}")
-        rows.append(row)
-    return pd.DataFrame(rows)
-
-
-def main():
-    frames = []
-    failed_years = []
-    
-    for y in YEARS:
-        df = fetch_year(UNITIDS, y)
-        if not df.empty:
-            frames.append(df)
-        else:
-            failed_years.append(y)
+
+        institution = NAME_MAP.get(row_id, item.get("school.name") or "Unknown")
+        schools.append((institution, row_id, item))
+
+    # Sorting the handful of schools up front (years are already sorted)
+    # produces rows ordered by (institution, year), so no DataFrame sort is needed
+    schools.sort(key=lambda school: school[0])
+
+    rows = []
+    years_with_data = set()
+    for institution, row_id, item in schools:
+        for y in years:
+            row = {
+                "institution": institution,
+                "unitid": row_id,
+                "year": y,
+            }
+
+            for metric, field in year_fields(y):
+                row[metric] = item.get(field)
+                if row[metric] is not None:
+                    years_with_data.add(y)
+            rows.append(row)
+
+    # Drop years the API has nothing for (e.g. not yet published)
+    for y in years:
+        if y not in years_with_data:
+            print(f"Warning: No data returned for year {y}")
+    return [row for row in rows if row["year"] in years_with_data]
+
+
+# Fetch each year with its own request, running them concurrently
+# Fallback for when the combined request fails, so one bad year doesn't
+# cost every year
+def fetch_years(institution_ids, years):
+    print("Retrying with one request per year...")
+    rows = []
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as ex:
+        futures = [ex.submit(fetch_rows, institution_ids, [y]) for y in years]
+        for future in as_completed(futures):
+            rows.extend(future.result())
+
+    # Requests finish in any order, so restore (institution, year) ordering
+    rows.sort(key=lambda row: (row["institution"], row["year"]))
+    return rows
+
+
+# Long format rows as a typed DataFrame
+# Non-numeric metric values (e.g. "PrivacySuppressed") become missing values
+# and a fractional enrollment is rounded to a whole count, so the astype to
+# DTYPES can't fail on them
+def rows_to_frame(rows):
+    df = pd.DataFrame(rows, columns=COLUMNS)
+    for metric in FIELD_MAP:
+        if df[metric].dtype.kind not in "fiub":
+            df[metric] = pd.to_numeric(df[metric], errors="coerce")
+    if df["enrollment_total"].dtype.kind == "f":
+        df["enrollment_total"] = df["enrollment_total"].round()
+    return df.astype(DTYPES)
+
+
+# Same as fetch_rows, as a DataFrame built once from the flat row list
+# Typed up front so no metric column is left as object dtype
+def fetch_all_years(institution_ids, years):
+    return rows_to_frame(fetch_rows(institution_ids, years))
+
+
+# Fetch a single year for all schools
+def fetch_year(institution_ids, year):
+    return fetch_all_years(institution_ids, [year])
+
+
+# Writes the CSV to output_dir (default: the current directory)
+def main(output_dir=None):
+    # The CSV path works on plain row dicts end to end; pandas is only
+    # used to hand a DataFrame back to callers
+    # Timestamp taken once so every output of this run shares the same date
+    now = datetime.now()
+    rows = fetch_rows(UNITIDS, YEARS)
     
-    if not frames:
+    if not rows:
         raise SystemExit("Error: No data retrieved for any years. Check API key and network connection.")
     
+    failed_years = sorted(set(YEARS) - {row["year"] for row in rows})
     if failed_years:
         print(f"Warning: Failed to retrieve data for years: {failed_years}")
     
-    long_df = pd.concat(frames, ignore_index=True)
-    long_df = normalize_percentages(long_df)
+    # Rows arrive sorted by institution and year
+    coerce_row_metrics(rows)
+    normalize_row_percentages(rows)
+    filename = build_filename(YEARS, now=now)
+    if output_dir is not None:
+        filename = os.path.join(output_dir, filename)
 
-    sorted_df = long_df.sort_values(['institution', 'year']).reset_index(drop=True)
-    filename = build_filename(YEARS)
+    # Built before the file is written, so a failure leaves no CSV behind
+    df = rows_to_frame(rows)
     
-    sorted_df.to_csv(filename, index=False)
-    print(f"Saved data: {filename} ({len(sorted_df)} rows, {len(sorted_df['institution'].unique())} institutions)")
-    return sorted_df
+    # Missing values (None) become empty fields
+    with open(filename, "w", newline="", encoding="utf-8", buffering=1 << 20) as f:
+        writer = csv.DictWriter(f, fieldnames=COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+    institutions = {row["institution"] for row in rows}
+    print(f"Saved data: {filename} ({len(rows)} rows, {len(institutions)} institutions)")
+    return df
 
 
 if __name__ == "__main__":
@@ -1,8 +1,15 @@
 import os
 import sqlite3
+import orjson
 import requests
+import numpy as np
 import pandas as pd
+from requests.adapters import HTTPAdapter
+from urllib3.util import make_headers
+from urllib3.util.retry import Retry
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -10,6 +17,29 @@ load_dotenv()
 API = "https://api.data.gov/ed/collegescorecard/v1/schools"
 API_KEY = os.getenv("SCORECARD_API_KEY")
 
+# Concurrent requests for the per-year fallback in fetch_years
+MAX_WORKERS = 8
+
+# Shared session so every request reuses the same pooled HTTPS connection
+# instead of paying a fresh TCP + TLS handshake per call
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=1,
+    pool_maxsize=MAX_WORKERS,
+    # raise_on_status=False hands back the last response once retries run
+    # out, so raise_for_status reports its real status code
+    max_retries=Retry(
+        total=3,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        raise_on_status=False,
+    ),
+))
+
+# Responses are mostly repeated field names and compress well, so advertise
+# every encoding urllib3 can decode here (gzip, deflate, and br via brotli)
+SESSION.headers.update(make_headers(accept_encoding=True))
+
 # DOE Unit Identification Numbers
 UNITIDS = [164748, 192110, 167057, 192712, 211893]
 YEARS = range(2012, 2022 + 1)
@@ -36,30 +66,129 @@ FIELD_MAP = {
     "avg_net_price": "cost.avg_net_price.private",
 }
 
+# Long format output columns: one row per school per year
+COLUMNS = ["institution", "unitid", "year", *FIELD_MAP.keys()]
+
+# dtypes for the long format frame; enrollment is a nullable integer count
+# and the few distinct institution names are stored as category codes
+DTYPES = {
+    "institution": "category",
+    "unitid": "int64",
+    "year": "int32",
+    "enrollment_total": "Int64",
+    "admission_rate": "float64",
+    "retention_rate_ft": "float64",
+    "grad_rate_150": "float64",
+    "tuition_fees": "float64",
+    "avg_net_price": "float64",
+}
+
+# school_metrics table columns, in insert order
+METRIC_COLUMNS = ["school_id", "year", *FIELD_MAP.keys()]
+
+# Metrics upsert, built once so every insert_metrics call passes the same
+# SQL text and hits sqlite3's prepared statement cache
+# A repeated (school_id, year) updates the metrics in place rather than
+# deleting and re-inserting the row
+INSERT_METRICS_SQL = f"""
+    INSERT INTO school_metrics ({", ".join(METRIC_COLUMNS)})
+    VALUES ({", ".join("?" * len(METRIC_COLUMNS))})
+    ON CONFLICT (school_id, year) DO UPDATE SET
+    {", ".join(f"{m} = excluded.{m}" for m in FIELD_MAP)}"""
+
+# Rebuilds one school's school_summary row from school_metrics, so a write
+# only re-aggregates the school it touched
+# {school_id} is filled in with NEW.school_id or OLD.school_id by the triggers
+SUMMARY_REFRESH_SQL = """
+        DELETE FROM school_summary WHERE school_id = {school_id};
+
+        INSERT INTO school_summary
+        SELECT s.school_id, s.institution_name, s.unitid,
+            COUNT(m.year) AS years_of_data,
+            MIN(m.year) AS first_year,
+            MAX(m.year) AS last_year,
+            ROUND(AVG(m.enrollment_total), 0) AS avg_enrollment,
+            ROUND(AVG(m.admission_rate), 2) AS avg_admission_rate,
+            ROUND(AVG(m.retention_rate_ft), 2) AS avg_retention_rate,
+            ROUND(AVG(m.grad_rate_150), 2) AS avg_grad_rate,
+            ROUND(AVG(m.tuition_fees), 2) AS avg_tuition,
+            ROUND(AVG(m.avg_net_price), 2) AS avg_net_price
+
+        FROM schools s
+        LEFT JOIN school_metrics m ON s.school_id = m.school_id
+        WHERE s.school_id = {school_id}
+        GROUP BY s.school_id, s.institution_name, s.unitid;"""
+
+# (name, event, body) of the triggers that keep school_summary current for
+# every write, including ad-hoc edits made with the sqlite3 shell
+SUMMARY_TRIGGERS = (
+    ("trg_schools_ai", "AFTER INSERT ON schools",
+        SUMMARY_REFRESH_SQL.format(school_id="NEW.school_id")),
+    ("trg_schools_au", "AFTER UPDATE ON schools",
+        "DELETE FROM school_summary WHERE school_id = OLD.school_id;"
+        + SUMMARY_REFRESH_SQL.format(school_id="NEW.school_id")),
+    ("trg_schools_ad", "AFTER DELETE ON schools",
+        "DELETE FROM school_summary WHERE school_id = OLD.school_id;"),
+    ("trg_metrics_ai", "AFTER INSERT ON school_metrics",
+        SUMMARY_REFRESH_SQL.format(school_id="NEW.school_id")),
+    ("trg_metrics_au", "AFTER UPDATE ON school_metrics",
+        SUMMARY_REFRESH_SQL.format(school_id="NEW.school_id")),
+    # Only when a row moves to another school does the old one need a rebuild
+    ("trg_metrics_au_moved",
+        "AFTER UPDATE OF school_id ON school_metrics WHEN OLD.school_id <> NEW.school_id",
+        SUMMARY_REFRESH_SQL.format(school_id="OLD.school_id")),
+    ("trg_metrics_ad", "AFTER DELETE ON school_metrics",
+        SUMMARY_REFRESH_SQL.format(school_id="OLD.school_id")),
+)
+
+# Metrics reported as rates, normalized to percentages
+PERCENT_FIELDS = ("admission_rate", "retention_rate_ft", "grad_rate_150")
+
 
 # Convert decimal values (0-1) to percentages (0-100) and round to 2 decimal places
-# If values are already in percentage format (>1 or <0), just round them
+# Values already in percentage format (>1 or <0) are just rounded
 def normalize_percentages(df: pd.DataFrame, percentage_fields=None) -> pd.DataFrame:
     if percentage_fields is None:
-        percentage_fields = ["admission_rate", "retention_rate_ft", "grad_rate_150"]
+        percentage_fields = PERCENT_FIELDS
 
     # c = column
-    # s = series
-    out = df.copy()
-    for c in percentage_fields:
-        if c in out.columns:
-            s = pd.to_numeric(out[c], errors="coerce")
-            if s.notna().any():
-                valid = s[s.notna()]
-                if len(valid) > 0 and valid.max() <= 1.0 and valid.min() >= 0:
-                    # Convert decimals to percentages
-                    out[c] = (s * 100).round(2)
-                else:
-                    # Already in percentage format, just round
-                    out[c] = s.round(2)
+    # m = matrix
+    # Shallow copy: untouched columns are shared with the input and each
+    # percentage column is replaced by a new array, so the input is never modified
+    out = df.copy(deep=False)
+    present = [c for c in percentage_fields if c in out.columns]
+    if not present:
+        return out
+
+    # One float64 block with a row per column (pd.NA from nullable dtypes
+    # becomes NaN), so the mask, scale and round each run once over every
+    # column instead of once per column
+    m = np.empty((len(present), len(out)))
+    for i, c in enumerate(present):
+        m[i] = to_float_array(out[c])
+
+    normalize_percentages_arr(m)
+    for i, c in enumerate(present):
+        out[c] = m[i]
     return out
 
 
+# Column values as float64, with missing or non-numeric values as NaN
+# Numeric columns (including nullable ones) skip pd.to_numeric entirely
+def to_float_array(s: pd.Series) -> np.ndarray:
+    if s.dtype.kind not in "fiub":
+        s = pd.to_numeric(s, errors="coerce")
+    return s.to_numpy(dtype=float, na_value=np.nan)
+
+
+# Array counterpart to normalize_percentages: applies the same rule to a
+# float64 array of rates, in place, with no pandas overhead
+# NaN fails both comparisons and passes through untouched
+def normalize_percentages_arr(arr: np.ndarray) -> np.ndarray:
+    np.multiply(arr, 100.0, out=arr, where=(arr >= 0) & (arr <= 1.0))
+    return np.round(arr, 2, out=arr)
+
+
 # Build a database filename with timestamp
 # Accepts optional datetime for testing
 def build_db_filename(now=None) -> str:
@@ -69,8 +198,39 @@ def build_db_filename(now=None) -> str:
     return f"music_schools_{timestamp}.db"
 
 
-def create_database(db_path="music_schools.db"):
+# Open the database and create its schema
+# Pass indexes=False when bulk loading and call create_indexes() afterwards
+def create_database(db_path="music_schools.db", indexes=True):
     conn = sqlite3.connect(db_path)
+
+    # The database is written once in bulk, so use WAL journaling with
+    # relaxed syncing (no fsync per commit) and keep temp data in memory
+    # WAL also lets readers query the views while a load is running
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+
+    # 64 MB page cache and up to 256 MB memory-mapped reads for this (loading)
+    # connection only; neither setting is saved in the database file
+    conn.execute("PRAGMA cache_size=-65536")
+    conn.execute("PRAGMA mmap_size=268435456")
+
+    create_schema(conn)
+    if indexes:
+        create_indexes(conn)
+    return conn
+
+
+# Switch back to rollback journaling and close
+# WAL mode is stored in the database file, so leaving it on would make the
+# delivered .db need -wal/-shm files next to it (e.g. to open read-only)
+def close_database(conn):
+    conn.execute("PRAGMA journal_mode=DELETE")
+    conn.close()
+
+
+# Tables and views, without secondary indexes
+def create_schema(conn):
     cursor = conn.cursor()
 
     # Schools dimension table
@@ -94,13 +254,6 @@ def create_database(db_path="music_schools.db"):
             PRIMARY KEY (school_id, year),
             FOREIGN KEY (school_id) REFERENCES schools(school_id))""")
 
-    # Indexes for common query patterns
-    cursor.execute(
-        "CREATE INDEX IF NOT EXISTS idx_metrics_year ON school_metrics(year)")
-
-    cursor.execute(
-        "CREATE INDEX IF NOT EXISTS idx_metrics_school ON school_metrics(school_id)")
-
     # Schools & Metrics View
     cursor.execute("""
         CREATE VIEW IF NOT EXISTS v_school_metrics AS
@@ -139,39 +292,61 @@ def create_database(db_path="music_schools.db"):
         FROM school_metrics m
         JOIN schools s ON m.school_id = s.school_id""")
 
+    # School Stats Summary Table
+    # Kept current by the SUMMARY_TRIGGERS so reads don't re-aggregate
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS school_summary (
+            school_id INTEGER PRIMARY KEY,
+            institution_name TEXT NOT NULL,
+            unitid INTEGER UNIQUE NOT NULL,
+            years_of_data INTEGER NOT NULL,
+            first_year INTEGER,
+            last_year INTEGER,
+            avg_enrollment REAL,
+            avg_admission_rate REAL,
+            avg_retention_rate REAL,
+            avg_grad_rate REAL,
+            avg_tuition REAL,
+            avg_net_price REAL)""")
+
     # School Stats Summary View
+    # Ordered by school_id, so schools are listed in the order they were added
     cursor.execute("""
         CREATE VIEW IF NOT EXISTS v_school_summary AS
+        SELECT institution_name, unitid, years_of_data, first_year, last_year,
+            avg_enrollment, avg_admission_rate, avg_retention_rate,
+            avg_grad_rate, avg_tuition, avg_net_price
+        FROM school_summary
+        ORDER BY school_id""")
 
-        SELECT s.institution_name, s.unitid,
-            COUNT(m.year) AS years_of_data,
-            MIN(m.year) AS first_year,
-            MAX(m.year) AS last_year,
-            ROUND(AVG(m.enrollment_total), 0) AS avg_enrollment,
-            ROUND(AVG(m.admission_rate), 2) AS avg_admission_rate,
-            ROUND(AVG(m.retention_rate_ft), 2) AS avg_retention_rate,
-            ROUND(AVG(m.grad_rate_150), 2) AS avg_grad_rate,
-            ROUND(AVG(m.tuition_fees), 2) AS avg_tuition,
-            ROUND(AVG(m.avg_net_price), 2) AS avg_net_price
-        
-        FROM schools s
-        LEFT JOIN school_metrics m ON s.school_id = m.school_id
-        GROUP BY s.school_id, s.institution_name, s.unitid""")
+    for name, event, body in SUMMARY_TRIGGERS:
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {event} BEGIN {body} END")
 
     conn.commit()
-    return conn
 
 
-def insert_schools(conn):
+# Indexes for common query patterns
+# Building them once over loaded data is cheaper than maintaining them per insert
+def create_indexes(conn):
     cursor = conn.cursor()
 
-    for unitid, name in NAME_MAP.items():
-        cursor.execute("""
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_metrics_year ON school_metrics(year)")
+
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_metrics_school ON school_metrics(school_id)")
+
+    conn.commit()
+
+
+# Insert the schools dimension rows in one transaction (a single commit)
+def insert_schools(conn):
+    with conn:
+        conn.executemany("""
             INSERT OR IGNORE INTO schools (unitid, institution_name)
             VALUES (?, ?)""",
-            (unitid, name),)
+            NAME_MAP.items(),)
 
-    conn.commit()
 
 def get_school_id(conn, unitid):
     cursor = conn.cursor()
@@ -180,119 +355,211 @@ def get_school_id(conn, unitid):
     return result[0] if result else None
 
 
-def fetch_year(institution_ids, year):
-    fields = ["id", "school.name"]
-    fields += [f"{year}.{f}" for f in FIELD_MAP.values()]
+# unitid -> school_id for every school, read in one query
+def get_school_ids(conn):
+    return dict(conn.execute("SELECT unitid, school_id FROM schools"))
+
+
+# (metric, year-prefixed API field) pairs for a year
+# Cached so the field strings are only built once per year
+@lru_cache(maxsize=None)
+def year_fields(year):
+    return tuple((metric, f"{year}.{suffix}") for metric, suffix in FIELD_MAP.items())
+
+
+# The same fields as one comma-joined string for the fields= parameter
+@lru_cache(maxsize=None)
+def joined_year_fields(year):
+    return ",".join(field for _, field in year_fields(year))
+
+
+# Failures worth retrying one year at a time: timeouts, connection errors
+# and 5xx responses. Other client errors (bad API key, rate limiting) would
+# fail the same way for every year
+def is_transient_error(ex):
+    if isinstance(ex, (requests.exceptions.Timeout, requests.exceptions.ConnectionError)):
+        return True
+    response = getattr(ex, "response", None)
+    return response is not None and response.status_code >= 500
+
+
+# Fetch every requested year for all schools in a single API call
+# Year-prefixed fields for all years are requested at once, then pivoted
+# into long format rows (one dict per school per year)
+def fetch_rows(institution_ids, years):
+    years = sorted(years)
+    wanted = frozenset(institution_ids)
     params = {
         "api_key": API_KEY,
         "id__in": ",".join(map(str, institution_ids)),
-        "fields": ",".join(fields),
+        "fields": ",".join(["id", "school.name", *map(joined_year_fields, years)]),
         "per_page": 100,
     }
 
     # res = response
     # ex = exception
     try:
-        res = requests.get(API, params=params, timeout=30)
+        res = SESSION.get(API, params=params, timeout=30)
         res.raise_for_status()
-        js = res.json()
+        js = orjson.loads(res.content)
     except requests.exceptions.RequestException as ex:
-        print(f"Error fetching data for year {year}: {ex}")
-        return pd.DataFrame()
+        print(f"Error fetching data for years {years}: {ex}")
+        return fetch_years(institution_ids, years) if len(years) > 1 and is_transient_error(ex) else []
     except ValueError as ex:
-        print(f"Error parsing JSON response for year {year}: {ex}")
-        return pd.DataFrame()
+        print(f"Error parsing JSON response for years {years}: {ex}")
+        return fetch_years(institution_ids, years) if len(years) > 1 else []
 
     results = js.get("results", [])
     if not results:
-        print(f"Warning: No data returned for year {year}")
-        return pd.DataFrame()
+        print(f"Warning: No data returned for years {years}")
+        return []
 
-    rows = []
+    schools = []
     for item in results:
+        # Skips results with no id and any school that wasn't requested
         row_id = item.get("id")
-        if not row_id:
+        if row_id not in wanted:
             continue
 
-        row = {
-            "institution": NAME_MAP.get(row_id, item.get("school.name", "Unknown")),
-            "unitid": row_id,
-            "year": year,
-        }
+        institution = NAME_MAP.get(row_id, item.get("school.name") or "Unknown")
+        schools.append((institution, row_id, item))
 
-        for metric, field_suffix in FIELD_MAP.items():
-            row[metric] = item.get(f"{year}.{field_suffix}")
-        rows.append(row)
-    return pd.DataFrame(rows)
+    # Sorting the handful of schools up front (years are already sorted)
+    # produces rows ordered by (institution, year), so no DataFrame sort is needed
+    schools.sort(key=lambda school: school[0])
 
+    rows = []
+    years_with_data = set()
+    for institution, row_id, item in schools:
+        for y in years:
+            row = {
+                "institution": institution,
+                "unitid": row_id,
+                "year": y,
+            }
+
+            for metric, field in year_fields(y):
+                row[metric] = item.get(field)
+                if row[metric] is not None:
+                    years_with_data.add(y)
+            rows.append(row)
+
+    # Drop years the API has nothing for (e.g. not yet published)
+    for y in years:
+        if y not in years_with_data:
+            print(f"Warning: No data returned for year {y}")
+    return [row for row in rows if row["year"] in years_with_data]
+
+
+# Fetch each year with its own request, running them concurrently
+# Fallback for when the combined request fails, so one bad year doesn't
+# cost every year
+def fetch_years(institution_ids, years):
+    print("Retrying with one request per year...")
+    rows = []
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as ex:
+        futures = [ex.submit(fetch_rows, institution_ids, [y]) for y in years]
+        for future in as_completed(futures):
+            rows.extend(future.result())
 
-# Insert metrics data into the school_metrics table
-def insert_metrics(conn, df):
-    cursor = conn.cursor()
+    # Requests finish in any order, so restore (institution, year) ordering
+    rows.sort(key=lambda row: (row["institution"], row["year"]))
+    return rows
 
-    # Add school_id to dataframe for sorting
-    df["school_id"] = df["unitid"].map(lambda x: get_school_id(conn, x))
-    df_sorted = df.sort_values(["school_id", "year"])
 
-    for _, row in df_sorted.iterrows():
-        school_id = row["school_id"]
-        if not school_id:
-            continue
+# Long format rows as a typed DataFrame
+# Non-numeric metric values (e.g. "PrivacySuppressed") become missing values
+# and a fractional enrollment is rounded to a whole count, so the astype to
+# DTYPES can't fail on them
+def rows_to_frame(rows):
+    df = pd.DataFrame(rows, columns=COLUMNS)
+    for metric in FIELD_MAP:
+        if df[metric].dtype.kind not in "fiub":
+            df[metric] = pd.to_numeric(df[metric], errors="coerce")
+    if df["enrollment_total"].dtype.kind == "f":
+        df["enrollment_total"] = df["enrollment_total"].round()
+    return df.astype(DTYPES)
 
-        try:
-            cursor.execute("""
-                INSERT OR REPLACE INTO school_metrics 
-                (school_id, year, enrollment_total, admission_rate, retention_rate_ft,
-                 grad_rate_150, tuition_fees, avg_net_price)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
-                (
-                    school_id,
-                    row["year"],
-                    row.get("enrollment_total"),
-                    row.get("admission_rate"),
-                    row.get("retention_rate_ft"),
-                    row.get("grad_rate_150"),
-                    row.get("tuition_fees"),
-                    row.get("avg_net_price"),
-                ),
-            )
-        except sqlite3.Error as err:
-            print(
-                f"Error inserting data for school_id {school_id}, year {row['year']}: {err}"
-            )
 
-    conn.commit()
+# Same as fetch_rows, as a DataFrame built once from the flat row list
+# Typed up front so no metric column is left as object dtype
+def fetch_all_years(institution_ids, years):
+    return rows_to_frame(fetch_rows(institution_ids, years))
+
 
-def main():
+# Fetch a single year for all schools
+def fetch_year(institution_ids, year):
+    return fetch_all_years(institution_ids, [year])
+
+
+# Insert metrics data into the school_metrics table
+# school_id is resolved through school_id_map (see get_school_ids), which is
+# read from the schools table when not given; unknown unitids are skipped
+# Returns False if the insert fails (the whole batch is rolled back)
+def insert_metrics(conn, df, school_id_map=None):
+    if school_id_map is None:
+        school_id_map = get_school_ids(conn)
+
+    school_ids = df["unitid"].map(school_id_map)
+    # Only filter (which copies the frame) when some unitids are unknown
+    if school_ids.hasnans:
+        known = school_ids.notna()
+        df, school_ids = df[known], school_ids[known]
+
+    # zip streams one tuple at a time into executemany, so no list of rows
+    # is ever built. Metrics go through object arrays so missing values
+    # (NaN, or pd.NA from nullable dtypes) are bound as NULL
+    rows = zip(
+        school_ids.astype(int),
+        df["year"],
+        *(df[metric].to_numpy(dtype=object, na_value=None) for metric in FIELD_MAP),
+    )
+    # One transaction for the whole batch: a single commit, and a failure
+    # rolls back every row instead of leaving a partial load
+    try:
+        with conn:
+            conn.executemany(INSERT_METRICS_SQL, rows)
+    except sqlite3.Error as err:
+        print(f"Error inserting metrics data: {err}")
+        return False
+    return True
+
+
+# Creates the database in output_dir (default: the current directory)
+def main(output_dir=None):
     print("Creating Database...")
     print("=" * 60)
 
-    db_path = build_db_filename()
-    conn = create_database(db_path)
-    insert_schools(conn)
-    failed_years = []
-    all_data = []
+    # Timestamp taken once so every output of this run shares the same date
+    now = datetime.now()
+    db_path = build_db_filename(now=now)
+    if output_dir is not None:
+        db_path = os.path.join(output_dir, db_path)
+    conn = create_database(db_path, indexes=False)
 
-    for year in YEARS:
-        print(f"\nFetching data for {year}...")
-        df = fetch_year(UNITIDS, year)
+    print(f"\nFetching data for {len(YEARS)} years...")
+    df = fetch_all_years(UNITIDS, YEARS)
+    if not df.empty:
+        df = normalize_percentages(df)
 
-        if not df.empty:
-            df = normalize_percentages(df)
-            all_data.append(df)
-        else:
-            failed_years.append(year)
-            print(f"  No data available for {year}")
+    # insert_schools and insert_metrics each commit their own transaction
+    insert_schools(conn)
+    if not df.empty and not insert_metrics(conn, df, get_school_ids(conn)):
+        close_database(conn)
+        raise SystemExit(f"Error: Failed to insert metrics data into {db_path}")
 
-    if all_data:
-        combined_df = pd.concat(all_data, ignore_index=True)
-        insert_metrics(conn, combined_df)
-        print(f"\nInserted {len(combined_df)} records into school_metrics table")
+    # Indexes are built after the bulk load
+    create_indexes(conn)
 
+    if not df.empty:
+        print(f"\nInserted {len(df)} records into school_metrics table")
+
+    fetched_years = set(df["year"]) if not df.empty else set()
+    failed_years = sorted(set(YEARS) - fetched_years)
     if failed_years:
         print(f"\nWarning: Failed to retrieve data for years: {failed_years}")
 
-    conn.close()
+    close_database(conn)
     print(f"\nDatabase saved as: {db_path}")
     print("\nAvailable views for easy querying:")
     print("  - v_school_metrics    : All data with school names")
@@ -3,10 +3,7 @@
 # =============================================================================
 
 
-import os
 import pandas as pd
-import requests
-from unittest.mock import patch, Mock
 
 import api_to_csv as mod
 
@@ -16,14 +13,6 @@ import api_to_csv as mod
 # =============================================================================
 
 
-# Create a mock requests.Response object
-def make_response(payload, status_code=200):
-    res = Mock()
-    res.status_code = status_code
-    res.json.return_value = payload
-    res.raise_for_status.return_value = None
-    return res
-
 # Create a single API result item with default metrics
 def make_api_result(unitid, year, **metrics):
     result = {
@@ -51,7 +40,7 @@ def make_api_result(unitid, year, **metrics):
 class TestMainIntegration:
 
     # Integration Test 1: Full pipeline produces valid CSV with correct data
-    def test_main_produces_valid_csv_with_correct_data(self, monkeypatch, tmp_path):
+    def test_main_produces_valid_csv_with_correct_data(self, monkeypatch, tmp_path, requests_mock):
         monkeypatch.setattr(mod, "API_KEY", "fake-key")
         
         # Use only 2 years and 2 schools for simplicity
@@ -61,93 +50,58 @@ class TestMainIntegration:
         test_unitids = [164748, 192110]
         monkeypatch.setattr(mod, "UNITIDS", test_unitids)
         
-        # Mock API responses for each year
-        def mock_get(url, params, timeout):
-            year = None
-            for field in params.get("fields", "").split(","):
-                if field.startswith("20"):
-                    year = int(field.split(".")[0])
-                    break
-            
-            payload = {
-                "results": [
-                    make_api_result(164748, year, **{
-                        "student.size": 1000 + (year - 2020) * 100,
-                        "admissions.admission_rate.overall": 0.50,
-                    }),
-                    make_api_result(192110, year, **{
-                        "student.size": 800 + (year - 2020) * 50,
-                        "admissions.admission_rate.overall": 0.08,
-                    }),
-                ]
-            }
-            return make_response(payload)
+        # Build the single multi-year API response once, up front
+        berklee, juilliard = {}, {}
+        for year in test_years:
+            berklee.update(make_api_result(164748, year, **{
+                "student.size": 1000 + (year - 2020) * 100,
+                "admissions.admission_rate.overall": 0.50,
+            }))
+            juilliard.update(make_api_result(192110, year, **{
+                "student.size": 800 + (year - 2020) * 50,
+                "admissions.admission_rate.overall": 0.08,
+            }))
+        
+        payload = {"results": [berklee, juilliard]}
+        
+        requests_mock.get(mod.API, json=payload)
+        result_df = mod.main(output_dir=tmp_path)
         
-        # Change to temp directory for output
-        original_cwd = os.getcwd()
-        os.chdir(tmp_path)
+        # Verify DataFrame structure
+        assert len(result_df) == 4  # 2 schools × 2 years
+        assert set(result_df["institution"].unique()) == {
+            "Berklee College of Music", 
+            "The Juilliard School"
+        }
+        assert set(result_df["year"].unique()) == {2020, 2021}
         
-        try:
-            with patch("api_to_csv.requests.get", side_effect=mock_get):
-                result_df = mod.main()
-            
-            # Verify DataFrame structure
-            assert len(result_df) == 4  # 2 schools × 2 years
-            assert set(result_df["institution"].unique()) == {
-                "Berklee College of Music", 
-                "The Juilliard School"
-            }
-            assert set(result_df["year"].unique()) == {2020, 2021}
-            
-            # Verify data was transformed (decimals → percentages)
-            assert result_df["admission_rate"].max() <= 100
-            assert result_df["admission_rate"].min() >= 0
-            
-            # Verify CSV file was created
-            csv_files = list(tmp_path.glob("*.csv"))
-            assert len(csv_files) == 1
-            
-            # Verify CSV content matches DataFrame
-            saved_df = pd.read_csv(csv_files[0])
-            assert len(saved_df) == len(result_df)
-            assert set(saved_df.columns) == set(result_df.columns)
-            
-        finally:
-            os.chdir(original_cwd)
+        # Verify data was transformed (decimals → percentages)
+        assert result_df["admission_rate"].max() <= 100
+        assert result_df["admission_rate"].min() >= 0
+        
+        # Verify CSV file was created
+        csv_files = list(tmp_path.glob("*.csv"))
+        assert len(csv_files) == 1
+        
+        # Verify CSV content matches DataFrame
+        saved_df = pd.read_csv(csv_files[0])
+        assert len(saved_df) == len(result_df)
+        assert set(saved_df.columns) == set(result_df.columns)
 
-    # Integration Test 2: Handles partial API failures gracefully
-    def test_main_handles_partial_api_failures(self, monkeypatch, tmp_path):
+    # Integration Test 2: Handles years missing from the API response gracefully
+    def test_main_handles_missing_years(self, monkeypatch, tmp_path, requests_mock):
         monkeypatch.setattr(mod, "API_KEY", "fake-key")
         monkeypatch.setattr(mod, "YEARS", [2020, 2021, 2022])
         monkeypatch.setattr(mod, "UNITIDS", [164748])
         
-        call_count = [0]
-        
-        def mock_get(url, params, timeout):
-            call_count[0] += 1
-            # Fail on second call (2021)
-            if call_count[0] == 2:
-                raise requests.exceptions.Timeout("Simulated timeout")
-            
-            year = None
-            for field in params.get("fields", "").split(","):
-                if field.startswith("20"):
-                    year = int(field.split(".")[0])
-                    break
-            
-            payload = {"results": [make_api_result(164748, year)]}
-            return make_response(payload)
+        # API has no data for 2021
+        result = make_api_result(164748, 2020)
+        result.update(make_api_result(164748, 2022))
+        payload = {"results": [result]}
         
-        original_cwd = os.getcwd()
-        os.chdir(tmp_path)
+        requests_mock.get(mod.API, json=payload)
+        result_df = mod.main(output_dir=tmp_path)
         
-        try:
-            with patch("api_to_csv.requests.get", side_effect=mock_get):
-                result_df = mod.main()
-            
-            # Should have data for 2 years (2020 and 2022), not 3
-            assert len(result_df) == 2
-            assert set(result_df["year"].unique()) == {2020, 2022}
-            
-        finally:
-            os.chdir(original_cwd)
+        # Should have data for 2 years (2020 and 2022), not 3
+        assert len(result_df) == 2
+        assert set(result_df["year"].unique()) == {2020, 2022}
@@ -3,10 +3,7 @@
 # =============================================================================
 
 
-import os
 import sqlite3
-import requests
-from unittest.mock import patch, Mock
 
 import api_to_sql as mod
 
@@ -16,15 +13,6 @@ import api_to_sql as mod
 # =============================================================================
 
 
-# Create a mock requests.Response object
-def make_response(payload, status_code=200):
-    res = Mock()
-    res.status_code = status_code
-    res.json.return_value = payload
-    res.raise_for_status.return_value = None
-    return res
-
-
 # Create a single API result item with default metrics
 def make_api_result(unitid, year, **metrics):
     result = {
@@ -52,7 +40,7 @@ def make_api_result(unitid, year, **metrics):
 class TestMainIntegration:
 
     # Integration Test 1: Full pipeline creates valid database with correct data
-    def test_main_creates_valid_database_with_correct_data(self, monkeypatch, tmp_path):
+    def test_main_creates_valid_database_with_correct_data(self, monkeypatch, tmp_path, requests_mock):
         monkeypatch.setattr(mod, "API_KEY", "fake-key")
         
         # Use only 2 years for speed
@@ -63,112 +51,82 @@ class TestMainIntegration:
         test_unitids = [164748, 192110]
         monkeypatch.setattr(mod, "UNITIDS", test_unitids)
         
-        # Mock API responses
-        def mock_get(url, params, timeout):
-            year = None
-            for field in params.get("fields", "").split(","):
-                if field.startswith("20"):
-                    year = int(field.split(".")[0])
-                    break
-            
-            payload = {
-                "results": [
-                    make_api_result(164748, year, **{
-                        "student.size": 1000 + (year - 2020) * 100,
-                        "admissions.admission_rate.overall": 0.50,
-                    }),
-                    make_api_result(192110, year, **{
-                        "student.size": 800 + (year - 2020) * 50,
-                        "admissions.admission_rate.overall": 0.08,
-                    }),
-                ]
-            }
-            return make_response(payload)
-        
-        # Use temp directory for database
-        original_cwd = os.getcwd()
-        os.chdir(tmp_path)
-        
-        try:
-            with patch("api_to_sql.requests.get", side_effect=mock_get):
-                mod.main()
-            
-            # Find the created database
-            db_files = list(tmp_path.glob("*.db"))
-            assert len(db_files) == 1
-            
-            # Verify database content
-            conn = sqlite3.connect(db_files[0])
-            cursor = conn.cursor()
-            
-            # Check schools table
-            cursor.execute("SELECT COUNT(*) FROM schools")
-            assert cursor.fetchone()[0] == 5  # All 5 schools from NAME_MAP
-            
-            # Check metrics table (2 schools × 2 years = 4 rows)
-            cursor.execute("SELECT COUNT(*) FROM school_metrics")
-            assert cursor.fetchone()[0] == 4
-            
-            # Verify data transformation (decimals → percentages)
-            cursor.execute("SELECT MAX(admission_rate) FROM school_metrics")
-            max_rate = cursor.fetchone()[0]
-            assert max_rate <= 100  # Converted to percentage
-            
-            # Verify views work
-            cursor.execute("SELECT COUNT(*) FROM v_school_metrics")
-            assert cursor.fetchone()[0] == 4
-            
-            cursor.execute("SELECT COUNT(*) FROM v_school_summary WHERE years_of_data > 0")
-            assert cursor.fetchone()[0] == 2  # Only 2 schools have data
-            
-            conn.close()
-            
-        finally:
-            os.chdir(original_cwd)
+        # Build the single multi-year API response once, up front
+        berklee, juilliard = {}, {}
+        for year in test_years:
+            berklee.update(make_api_result(164748, year, **{
+                "student.size": 1000 + (year - 2020) * 100,
+                "admissions.admission_rate.overall": 0.50,
+            }))
+            juilliard.update(make_api_result(192110, year, **{
+                "student.size": 800 + (year - 2020) * 50,
+                "admissions.admission_rate.overall": 0.08,
+            }))
+        
+        payload = {"results": [berklee, juilliard]}
+        
+        requests_mock.get(mod.API, json=payload)
+        mod.main(output_dir=tmp_path)
+        
+        # Find the created database
+        db_files = list(tmp_path.glob("*.db"))
+        assert len(db_files) == 1
+        
+        # Verify database content
+        conn = sqlite3.connect(db_files[0])
+        cursor = conn.cursor()
+        
+        # Check schools table
+        cursor.execute("SELECT COUNT(*) FROM schools")
+        assert cursor.fetchone()[0] == 5  # All 5 schools from NAME_MAP
+        
+        # Check metrics table (2 schools × 2 years = 4 rows)
+        cursor.execute("SELECT COUNT(*) FROM school_metrics")
+        assert cursor.fetchone()[0] == 4
+        
+        # Verify data transformation (decimals → percentages)
+        cursor.execute("SELECT MAX(admission_rate) FROM school_metrics")
+        max_rate = cursor.fetchone()[0]
+        assert max_rate <= 100  # Converted to percentage
+        
+        # Verify views work
+        cursor.execute("SELECT COUNT(*) FROM v_school_metrics")
+        assert cursor.fetchone()[0] == 4
+        
+        cursor.execute("SELECT COUNT(*) FROM v_school_summary WHERE years_of_data > 0")
+        assert cursor.fetchone()[0] == 2  # Only 2 schools have data
+        
+        # WAL is only used during the load; the delivered file is self-contained
+        cursor.execute("PRAGMA journal_mode")
+        assert cursor.fetchone()[0] == "delete"
+        assert not list(tmp_path.glob("*.db-wal"))
+        
+        conn.close()
 
-    # Integration Test 2: Handles partial API failures gracefully
-    def test_main_handles_partial_api_failures(self, monkeypatch, tmp_path):
+    # Integration Test 2: Handles years missing from the API response gracefully
+    def test_main_handles_missing_years(self, monkeypatch, tmp_path, requests_mock):
         monkeypatch.setattr(mod, "API_KEY", "fake-key")
         monkeypatch.setattr(mod, "YEARS", [2020, 2021, 2022])
         monkeypatch.setattr(mod, "UNITIDS", [164748])
         
-        call_count = [0]
-        
-        def mock_get(url, params, timeout):
-            call_count[0] += 1
-            # Fail on second call (2021)
-            if call_count[0] == 2:
-                raise requests.exceptions.Timeout("Simulated timeout")
-            
-            year = None
-            for field in params.get("fields", "").split(","):
-                if field.startswith("20"):
-                    year = int(field.split(".")[0])
-                    break
-            
-            payload = {"results": [make_api_result(164748, year)]}
-            return make_response(payload)
-        
-        original_cwd = os.getcwd()
-        os.chdir(tmp_path)
-        
-        try:
-            with patch("api_to_sql.requests.get", side_effect=mock_get):
-                mod.main()
-            
-            db_files = list(tmp_path.glob("*.db"))
-            conn = sqlite3.connect(db_files[0])
-            cursor = conn.cursor()
-            
-            # Should have data for 2 years (2020 and 2022), not 3
-            cursor.execute("SELECT COUNT(*) FROM school_metrics")
-            assert cursor.fetchone()[0] == 2
-            
-            cursor.execute("SELECT year FROM school_metrics ORDER BY year")
-            years = [row[0] for row in cursor.fetchall()]
-            assert years == [2020, 2022]
-            
-            conn.close()
-            
-        finally:
-            os.chdir(original_cwd)
+        # API has no data for 2021
+        result = make_api_result(164748, 2020)
+        result.update(make_api_result(164748, 2022))
+        payload = {"results": [result]}
+        
+        requests_mock.get(mod.API, json=payload)
+        mod.main(output_dir=tmp_path)
+        
+        db_files = list(tmp_path.glob("*.db"))
+        conn = sqlite3.connect(db_files[0])
+        cursor = conn.cursor()
+        
+        # Should have data for 2 years (2020 and 2022), not 3
+        cursor.execute("SELECT COUNT(*) FROM school_metrics")
+        assert cursor.fetchone()[0] == 2
+        
+        cursor.execute("SELECT year FROM school_metrics ORDER BY year")
+        years = [row[0] for row in cursor.fetchall()]
+        assert years == [2020, 2022]
+        
+        conn.close()
@@ -5,11 +5,11 @@
 # Tests are designed to run offline using mocked API responses
 # Covers fetch_year(), normalize_percentages(), and build_filename()
 
+import numpy as np
 import pandas as pd
 import pytest
 import requests
 from datetime import datetime
-from unittest.mock import patch, Mock
 
 import api_to_csv as mod
 
@@ -18,14 +18,6 @@ import api_to_csv as mod
 # Fixtures and Helpers
 # =============================================================================
 
-# Create a mock requests.Response object
-def make_response(payload, status_code=200):
-    res = Mock()
-    res.status_code = status_code
-    res.json.return_value = payload  # Return the payload as JSON
-    res.raise_for_status.return_value = None  # No exception raised
-    return res
-
 # Helper to create a single API result item
 # Defaults are provided for common metrics
 def make_api_result(unitid, year, school_name=None, **metrics):
@@ -52,6 +44,11 @@ def make_api_result(unitid, year, school_name=None, **metrics):
 
     return result
 
+# Years requested through the year-prefixed fields param of a mocked request
+def requested_years(request):
+    fields = request.qs["fields"][0].split(",")
+    return sorted({int(f.split(".")[0]) for f in fields if f[:1].isdigit()})
+
 
 # =============================================================================
 # Tests for fetch_year()
@@ -61,7 +58,7 @@ def make_api_result(unitid, year, school_name=None, **metrics):
 class TestFetchYear:
 
     # Test 1 (Happy path): Returns a DataFrame with all expected columns on success
-    def test_happy_path_returns_dataframe_with_expected_columns(self, monkeypatch):
+    def test_happy_path_returns_dataframe_with_expected_columns(self, monkeypatch, requests_mock):
         monkeypatch.setattr(mod, "API_KEY", "fake-key")
 
         year = 2020
@@ -72,9 +69,8 @@ class TestFetchYear:
             ]
         }
 
-        with patch("api_to_csv.requests.get") as mock_get:
-            mock_get.return_value = make_response(payload)
-            df = mod.fetch_year([164748, 192110], year)
+        requests_mock.get(mod.API, json=payload)
+        df = mod.fetch_year([164748, 192110], year)
 
         # Verify DataFrame structure
         assert not df.empty
@@ -89,7 +85,7 @@ class TestFetchYear:
             assert metric in df.columns
 
     # Test 2 (Happy path): Maps institution names correctly
-    def test_maps_institution_names_correctly(self, monkeypatch):
+    def test_maps_institution_names_correctly(self, monkeypatch, requests_mock):
         monkeypatch.setattr(mod, "API_KEY", "fake-key")
 
         year = 2020
@@ -100,9 +96,8 @@ class TestFetchYear:
             ]
         }
 
-        with patch("api_to_csv.requests.get") as mock_get:
-            mock_get.return_value = make_response(payload)
-            df = mod.fetch_year([164748, 192110], year)
+        requests_mock.get(mod.API, json=payload)
+        df = mod.fetch_year([164748, 192110], year)
 
         berklee_row = df[df["unitid"] == 164748].iloc[0]
         juilliard_row = df[df["unitid"] == 192110].iloc[0]
@@ -111,7 +106,7 @@ class TestFetchYear:
         assert juilliard_row["institution"] == "The Juilliard School"
 
     # Test 3: Extracts metric values correctly
-    def test_extracts_metric_values_correctly(self, monkeypatch):
+    def test_extracts_metric_values_correctly(self, monkeypatch, requests_mock):
         monkeypatch.setattr(mod, "API_KEY", "fake-key")
 
         year = 2020
@@ -130,9 +125,8 @@ class TestFetchYear:
             ]
         }
 
-        with patch("api_to_csv.requests.get") as mock_get:
-            mock_get.return_value = make_response(payload)
-            df = mod.fetch_year([164748], year)
+        requests_mock.get(mod.API, json=payload)
+        df = mod.fetch_year([164748], year)
 
         row = df.iloc[0]
         assert row["enrollment_total"] == 1234
@@ -143,7 +137,7 @@ class TestFetchYear:
         assert row["avg_net_price"] == 30000
 
     # Test 4 (Edge case): Skips results with missing 'id' field
-    def test_skips_results_with_missing_id(self, monkeypatch):
+    def test_skips_results_with_missing_id(self, monkeypatch, requests_mock):
         monkeypatch.setattr(mod, "API_KEY", "fake-key")
 
         year = 2020
@@ -154,72 +148,61 @@ class TestFetchYear:
             ]
         }
 
-        with patch("api_to_csv.requests.get") as mock_get:
-            mock_get.return_value = make_response(payload)
-            df = mod.fetch_year([164748], year)
+        requests_mock.get(mod.API, json=payload)
+        df = mod.fetch_year([164748], year)
 
         assert len(df) == 1
         assert df["unitid"].iloc[0] == 164748
 
     # Test 5: Returns empty DataFrame when API returns no results
-    def test_returns_empty_dataframe_on_empty_results(self, monkeypatch):
+    def test_returns_empty_dataframe_on_empty_results(self, monkeypatch, requests_mock):
         monkeypatch.setattr(mod, "API_KEY", "fake-key")
 
         payload = {"results": []}
 
-        with patch("api_to_csv.requests.get") as mock_get:
-            mock_get.return_value = make_response(payload)
-            df = mod.fetch_year([164748], 2020)
+        requests_mock.get(mod.API, json=payload)
+        df = mod.fetch_year([164748], 2020)
 
         assert df.empty
 
     # Test 6 (Error path): Returns empty DataFrame on network timeout
-    def test_returns_empty_dataframe_on_request_timeout(self, monkeypatch):
+    def test_returns_empty_dataframe_on_request_timeout(self, monkeypatch, requests_mock):
         monkeypatch.setattr(mod, "API_KEY", "fake-key")
 
-        with patch("api_to_csv.requests.get") as mock_get:
-            mock_get.side_effect = requests.exceptions.Timeout("Connection timed out")
-            df = mod.fetch_year([164748], 2020)
+        requests_mock.get(mod.API, exc=requests.exceptions.Timeout("Connection timed out"))
+        df = mod.fetch_year([164748], 2020)
 
         assert df.empty
 
     # Test 7: Returns empty DataFrame on connection error
-    def test_returns_empty_dataframe_on_connection_error(self, monkeypatch):
+    def test_returns_empty_dataframe_on_connection_error(self, monkeypatch, requests_mock):
         monkeypatch.setattr(mod, "API_KEY", "fake-key")
 
-        with patch("api_to_csv.requests.get") as mock_get:
-            mock_get.side_effect = requests.exceptions.ConnectionError("Network unreachable")
-            df = mod.fetch_year([164748], 2020)
+        requests_mock.get(mod.API, exc=requests.exceptions.ConnectionError("Network unreachable"))
+        df = mod.fetch_year([164748], 2020)
 
         assert df.empty
 
     # Test 8 (Error path): Returns empty DataFrame on HTTP error
-    def test_returns_empty_dataframe_on_http_error(self, monkeypatch):
+    def test_returns_empty_dataframe_on_http_error(self, monkeypatch, requests_mock):
         monkeypatch.setattr(mod, "API_KEY", "fake-key")
 
-        with patch("api_to_csv.requests.get") as mock_get:
-            mock_response = Mock()
-            mock_response.raise_for_status.side_effect = requests.exceptions.HTTPError("500 Server Error")
-            mock_get.return_value = mock_response
-            df = mod.fetch_year([164748], 2020)
+        requests_mock.get(mod.API, status_code=500)
+        df = mod.fetch_year([164748], 2020)
 
         assert df.empty
 
     # Test 9: Returns empty DataFrame on invalid JSON
-    def test_returns_empty_dataframe_on_invalid_json(self, monkeypatch):
+    def test_returns_empty_dataframe_on_invalid_json(self, monkeypatch, requests_mock):
         monkeypatch.setattr(mod, "API_KEY", "fake-key")
 
-        with patch("api_to_csv.requests.get") as mock_get:
-            mock_response = Mock()
-            mock_response.raise_for_status.return_value = None
-            mock_response.json.side_effect = ValueError("Invalid JSON")
-            mock_get.return_value = mock_response
-            df = mod.fetch_year([164748], 2020)
+        requests_mock.get(mod.API, text="not valid json")
+        df = mod.fetch_year([164748], 2020)
 
         assert df.empty
 
     # Test 10 (Edge case): Uses fallback name for unknown unitid
-    def test_uses_fallback_name_for_unknown_unitid(self, monkeypatch):
+    def test_uses_fallback_name_for_unknown_unitid(self, monkeypatch, requests_mock):
         monkeypatch.setattr(mod, "API_KEY", "fake-key")
 
         year = 2020
@@ -234,12 +217,24 @@ class TestFetchYear:
             ]
         }
 
-        with patch("api_to_csv.requests.get") as mock_get:
-            mock_get.return_value = make_response(payload)
-            df = mod.fetch_year([unknown_unitid], year)
+        requests_mock.get(mod.API, json=payload)
+        df = mod.fetch_year([unknown_unitid], year)
 
         assert df["institution"].iloc[0] == "Unknown School"
 
+    # Test 11 (Edge case): A null school name becomes "Unknown" and still sorts
+    def test_handles_null_school_name(self, monkeypatch, requests_mock):
+        monkeypatch.setattr(mod, "API_KEY", "fake-key")
+
+        unnamed = make_api_result(999999, 2020)
+        unnamed["school.name"] = None
+        payload = {"results": [unnamed, make_api_result(164748, 2020)]}
+
+        requests_mock.get(mod.API, json=payload)
+        df = mod.fetch_year([999999, 164748], 2020)
+
+        assert df["institution"].tolist() == ["Berklee College of Music", "Unknown"]
+
 
 # =============================================================================
 # Tests for normalize_percentages()
@@ -248,7 +243,7 @@ class TestFetchYear:
 
 class TestNormalizePercentages:
 
-    # Test 11 (Happy path): Converts decimals to percentages
+    # Test 12 (Happy path): Converts decimals to percentages
     def test_converts_decimals_to_percentages(self):
         df = pd.DataFrame({
             "admission_rate": [0.5, 0.25, 0.1],
@@ -262,7 +257,7 @@ class TestNormalizePercentages:
         assert result["retention_rate_ft"].tolist() == [90.0, 85.0, 95.0]
         assert result["grad_rate_150"].tolist() == [75.0, 60.0, 80.0]
 
-    # Test 12 (Edge case): Rounds to two decimal places
+    # Test 13 (Edge case): Rounds to two decimal places
 
     # Note: Values don't hit exact midpoints
     # to avoid banker's rounding edge cases
@@ -275,7 +270,7 @@ class TestNormalizePercentages:
 
         assert result["admission_rate"].tolist() == [12.34, 98.77, 33.33]
 
-    # Test 13: Handles already percentage values
+    # Test 14: Handles already percentage values
     def test_handles_already_percentage_values(self):
         df = pd.DataFrame({
             "admission_rate": [50.123, 25.456, -1.0],  # Already percentages or negative
@@ -286,7 +281,7 @@ class TestNormalizePercentages:
         # Should just round, not multiply by 100
         assert result["admission_rate"].tolist() == [50.12, 25.46, -1.0]
 
-    # Test 14 (Edge case): Handles None and NaN values
+    # Test 15 (Edge case): Handles None and NaN values
     def test_handles_none_and_nan_values(self):
         df = pd.DataFrame({
             "admission_rate": [0.5, None, 0.3],
@@ -299,7 +294,7 @@ class TestNormalizePercentages:
         assert pd.isna(result["admission_rate"].iloc[1])
         assert result["admission_rate"].iloc[2] == 30.0
 
-    # Test 15: Handles string values
+    # Test 16: Handles string values
     def test_handles_string_values(self):
         df = pd.DataFrame({
             "admission_rate": ["0.5", "bad", "0.3"],
@@ -311,7 +306,7 @@ class TestNormalizePercentages:
         assert pd.isna(result["admission_rate"].iloc[1])
         assert result["admission_rate"].iloc[2] == 30.0
 
-    # Test 16 (Edge case): Handles zero and one boundary values
+    # Test 17 (Edge case): Handles zero and one boundary values
     def test_handles_zero_and_one_boundary_values(self):
         df = pd.DataFrame({
             "admission_rate": [0.0, 1.0, 0.5],
@@ -321,7 +316,7 @@ class TestNormalizePercentages:
 
         assert result["admission_rate"].tolist() == [0.0, 100.0, 50.0]
 
-    # Test 17: Does not modify original dataframe
+    # Test 18: Does not modify original dataframe
     def test_does_not_modify_original_dataframe(self):
         df = pd.DataFrame({
             "admission_rate": [0.5, 0.25],
@@ -332,7 +327,7 @@ class TestNormalizePercentages:
 
         assert df["admission_rate"].tolist() == original_values
 
-    # Test 18 (Edge case): Handles missing columns
+    # Test 19 (Edge case): Handles missing columns
     def test_handles_missing_columns(self):
         df = pd.DataFrame({
             "admission_rate": [0.5, 0.25],
@@ -344,7 +339,7 @@ class TestNormalizePercentages:
         assert result["admission_rate"].tolist() == [50.0, 25.0]
         assert "retention_rate_ft" not in result.columns
 
-    # Test 19: Handles custom percentage fields
+    # Test 20: Handles custom percentage fields
     def test_custom_percentage_fields(self):
         df = pd.DataFrame({
             "custom_rate": [0.5, 0.25],
@@ -358,7 +353,7 @@ class TestNormalizePercentages:
         # admission_rate should be unchanged (not in custom fields)
         assert result["admission_rate"].tolist() == [0.9, 0.8]
 
-    # Test 20 (Edge case): Handles empty dataframe
+    # Test 21 (Edge case): Handles empty dataframe
     def test_handles_empty_dataframe(self):
         df = pd.DataFrame(columns=["admission_rate", "retention_rate_ft"])
 
@@ -367,6 +362,48 @@ class TestNormalizePercentages:
         assert result.empty
         assert "admission_rate" in result.columns
 
+    # Test 22 (Edge case): Converts each value independently
+    def test_converts_values_independently(self):
+        df = pd.DataFrame({
+            "admission_rate": [0.5, 50.0, None],
+        })
+
+        result = mod.normalize_percentages(df)
+
+        assert result["admission_rate"].iloc[0] == 50.0
+        assert result["admission_rate"].iloc[1] == 50.0
+        assert pd.isna(result["admission_rate"].iloc[2])
+
+    # Test 23 (Edge case): Handles pandas nullable dtypes
+    def test_handles_nullable_dtypes(self):
+        df = pd.DataFrame({
+            "admission_rate": pd.array([0.5, None, 0.25], dtype="Float64"),
+        })
+
+        result = mod.normalize_percentages(df)
+
+        assert result["admission_rate"].iloc[0] == 50.0
+        assert pd.isna(result["admission_rate"].iloc[1])
+        assert result["admission_rate"].iloc[2] == 25.0
+
+    # Test 24 (Happy path): Array helper normalizes a float64 array in place
+    def test_array_helper_normalizes_in_place(self):
+        arr = np.array([[0.5, 85.123, np.nan], [-0.5, 1.0, 0.12346]])
+
+        result = mod.normalize_percentages_arr(arr)
+
+        assert result is arr
+        np.testing.assert_array_equal(arr, [[50.0, 85.12, np.nan], [-0.5, 100.0, 12.35]])
+
+    # Test 25 (Edge case): Column coercion handles numeric and mixed inputs
+    def test_to_float_array_coerces_columns(self):
+        numeric = mod.to_float_array(pd.Series([1, 2], dtype="Int64"))
+        mixed = mod.to_float_array(pd.Series([0.5, "bad", None], dtype=object))
+
+        assert numeric.dtype == np.float64
+        np.testing.assert_array_equal(numeric, [1.0, 2.0])
+        np.testing.assert_array_equal(mixed, [0.5, np.nan, np.nan])
+
 
 # =============================================================================
 # Tests for build_filename()
@@ -375,7 +412,7 @@ class TestNormalizePercentages:
 
 class TestBuildFilename:
 
-    # Test 21: Generates correct format
+    # Test 26: Generates correct format
     def test_generates_correct_format(self):
         years = range(2012, 2022 + 1)
         fixed_time = datetime(2026, 1, 28, 12, 0, 0)
@@ -384,7 +421,7 @@ class TestBuildFilename:
 
         assert result == "music_school_data_2012_2022_20260128.csv"
 
-    # Test 22 (Edge case): Handles single year
+    # Test 27 (Edge case): Handles single year
     def test_handles_single_year(self):
         years = [2020]
         fixed_time = datetime(2026, 1, 28, 12, 0, 0)
@@ -393,7 +430,7 @@ class TestBuildFilename:
 
         assert result == "music_school_data_2020_2020_20260128.csv"
 
-    # Test 23: Handles non-contiguous years
+    # Test 28: Handles non-contiguous years
     def test_handles_non_contiguous_years(self):
         years = [2012, 2015, 2020]
         fixed_time = datetime(2026, 1, 28, 12, 0, 0)
@@ -402,7 +439,7 @@ class TestBuildFilename:
 
         assert result == "music_school_data_2012_2020_20260128.csv"
 
-    # Test 24 (Edge case): Uses current time when now parameter is None
+    # Test 29 (Edge case): Uses current time when now parameter is None
     def test_uses_current_time_when_not_provided(self):
         years = range(2012, 2022 + 1)
 
@@ -414,7 +451,7 @@ class TestBuildFilename:
         assert result.startswith("music_school_data_2012_2022_")
         assert result.endswith(".csv")
 
-    # Test 25 (Edge case): Different dates produce different filenames
+    # Test 30 (Edge case): Different dates produce different filenames
     def test_different_dates_produce_different_filenames(self):
         years = range(2012, 2022 + 1)
         date1 = datetime(2026, 1, 28, 12, 0, 0)
@@ -426,3 +463,313 @@ class TestBuildFilename:
         assert result1 != result2
         assert "20260128" in result1
         assert "20260215" in result2
+
+    # Test 31 (Edge case): Uses the endpoints of a stepped range
+    def test_handles_stepped_range(self):
+        years = range(2012, 2022 + 1, 5)  # 2012, 2017, 2022
+        fixed_time = datetime(2026, 1, 28, 12, 0, 0)
+
+        result = mod.build_filename(years, now=fixed_time)
+
+        assert result == "music_school_data_2012_2022_20260128.csv"
+
+
+# =============================================================================
+# Tests for fetch_all_years()
+# =============================================================================
+
+
+class TestFetchAllYears:
+
+    # Test 32 (Happy path): Requests every year in a single API call
+    def test_issues_single_request_for_all_years(self, monkeypatch, requests_mock):
+        monkeypatch.setattr(mod, "API_KEY", "fake-key")
+
+        result = make_api_result(164748, 2019)
+        result.update(make_api_result(164748, 2020))
+        payload = {"results": [result]}
+
+        requests_mock.get(mod.API, json=payload)
+        mod.fetch_all_years([164748], [2019, 2020])
+
+        assert requests_mock.call_count == 1
+        fields = requests_mock.last_request.qs["fields"][0].split(",")
+        for field in mod.FIELD_MAP.values():
+            assert f"2019.{field}" in fields
+            assert f"2020.{field}" in fields
+
+    # Test 33 (Happy path): Returns one row per school per year
+    def test_returns_long_format_rows(self, monkeypatch, requests_mock):
+        monkeypatch.setattr(mod, "API_KEY", "fake-key")
+
+        berklee = make_api_result(164748, 2019, **{"student.size": 900})
+        berklee.update(make_api_result(164748, 2020, **{"student.size": 1000}))
+        juilliard = make_api_result(192110, 2019)
+        juilliard.update(make_api_result(192110, 2020))
+        payload = {"results": [berklee, juilliard]}
+
+        requests_mock.get(mod.API, json=payload)
+        df = mod.fetch_all_years([164748, 192110], [2019, 2020])
+
+        assert len(df) == 4
+        assert set(df["year"]) == {2019, 2020}
+
+        berklee_2019 = df[(df["unitid"] == 164748) & (df["year"] == 2019)].iloc[0]
+        assert berklee_2019["enrollment_total"] == 900
+        assert berklee_2019["institution"] == "Berklee College of Music"
+
+    # Test 34 (Edge case): Drops years with no data for any school
+    def test_drops_years_without_data(self, monkeypatch, requests_mock):
+        monkeypatch.setattr(mod, "API_KEY", "fake-key")
+
+        # No 2021 fields in the response
+        result = make_api_result(164748, 2020)
+        result.update(make_api_result(164748, 2022))
+        payload = {"results": [result]}
+
+        requests_mock.get(mod.API, json=payload)
+        df = mod.fetch_all_years([164748], [2020, 2021, 2022])
+
+        assert len(df) == 2
+        assert set(df["year"]) == {2020, 2022}
+
+    # Test 35 (Error path): Returns empty DataFrame when the request fails
+    def test_returns_empty_dataframe_on_request_error(self, monkeypatch, requests_mock):
+        monkeypatch.setattr(mod, "API_KEY", "fake-key")
+
+        requests_mock.get(mod.API, exc=requests.exceptions.Timeout("Connection timed out"))
+        df = mod.fetch_all_years([164748], [2020, 2021])
+
+        assert df.empty
+
+    # Test 36: Returns rows sorted by institution, then year
+    def test_returns_rows_sorted_by_institution_and_year(self, monkeypatch, requests_mock):
+        monkeypatch.setattr(mod, "API_KEY", "fake-key")
+
+        juilliard = make_api_result(192110, 2020)
+        juilliard.update(make_api_result(192110, 2019))
+        berklee = make_api_result(164748, 2020)
+        berklee.update(make_api_result(164748, 2019))
+        payload = {"results": [juilliard, berklee]}
+
+        requests_mock.get(mod.API, json=payload)
+        df = mod.fetch_all_years([192110, 164748], [2020, 2019])
+
+        assert df["institution"].tolist() == [
+            "Berklee College of Music",
+            "Berklee College of Music",
+            "The Juilliard School",
+            "The Juilliard School",
+        ]
+        assert df["year"].tolist() == [2019, 2020, 2019, 2020]
+
+    # Test 37 (Edge case): Ignores results for schools that weren't requested
+    def test_ignores_unrequested_schools(self, monkeypatch, requests_mock):
+        monkeypatch.setattr(mod, "API_KEY", "fake-key")
+
+        payload = {"results": [
+            make_api_result(164748, 2020),
+            make_api_result(192110, 2020),
+        ]}
+
+        requests_mock.get(mod.API, json=payload)
+        df = mod.fetch_all_years([164748], [2020])
+
+        assert df["unitid"].tolist() == [164748]
+
+    # Test 38 (Edge case): Columns are typed even when values are missing
+    def test_returns_typed_columns(self, monkeypatch, requests_mock):
+        monkeypatch.setattr(mod, "API_KEY", "fake-key")
+
+        payload = {"results": [
+            make_api_result(164748, 2020),
+            {"id": 192110, "school.name": "The Juilliard School"},  # No metrics
+        ]}
+
+        requests_mock.get(mod.API, json=payload)
+        df = mod.fetch_all_years([164748, 192110], [2020])
+
+        for column, dtype in mod.DTYPES.items():
+            assert df[column].dtype == dtype
+        assert df["enrollment_total"].isna().tolist() == [False, True]
+
+    # Test 39 (Edge case): Non-numeric metric values become missing values
+    def test_coerces_non_numeric_values(self, monkeypatch, requests_mock):
+        monkeypatch.setattr(mod, "API_KEY", "fake-key")
+
+        result = make_api_result(164748, 2020, **{
+            "student.size": "PrivacySuppressed",
+            "admissions.admission_rate.overall": "PrivacySuppressed",
+        })
+        payload = {"results": [result]}
+
+        requests_mock.get(mod.API, json=payload)
+        df = mod.fetch_all_years([164748], [2020])
+
+        assert len(df) == 1
+        assert pd.isna(df["enrollment_total"].iloc[0])
+        assert pd.isna(df["admission_rate"].iloc[0])
+        assert df["admission_rate"].dtype == "float64"
+        assert df["tuition_fees"].iloc[0] == 50000
+
+    # Test 40 (Edge case): A fractional enrollment is rounded instead of failing the Int64 cast
+    def test_rounds_fractional_enrollment(self, monkeypatch, requests_mock):
+        monkeypatch.setattr(mod, "API_KEY", "fake-key")
+
+        payload = {"results": [
+            make_api_result(164748, 2020, **{"student.size": 1234.6}),
+            make_api_result(192110, 2020, **{"student.size": None}),
+        ]}
+
+        requests_mock.get(mod.API, json=payload)
+        df = mod.fetch_all_years([164748, 192110], [2020])
+
+        assert df["enrollment_total"].dtype == "Int64"
+        assert df["enrollment_total"].iloc[0] == 1235
+        assert pd.isna(df["enrollment_total"].iloc[1])
+
+
+# =============================================================================
+# Tests for fetch_years()
+# =============================================================================
+
+
+class TestFetchYears:
+
+    # Test 41 (Error path): Falls back to per-year requests when the combined request fails
+    def test_falls_back_to_per_year_requests(self, monkeypatch, requests_mock):
+        monkeypatch.setattr(mod, "API_KEY", "fake-key")
+
+        def respond(request, context):
+            years = requested_years(request)
+            if len(years) > 1:
+                raise requests.exceptions.Timeout("Combined request timed out")
+            return {"results": [make_api_result(164748, years[0])]}
+
+        requests_mock.get(mod.API, json=respond)
+        df = mod.fetch_all_years([164748], [2019, 2020, 2021])
+
+        assert requests_mock.call_count == 4  # 1 combined + 3 per year
+        assert df["year"].tolist() == [2019, 2020, 2021]
+
+    # Test 42 (Edge case): Keeps the years whose requests succeed
+    def test_keeps_successful_years(self, monkeypatch, requests_mock):
+        monkeypatch.setattr(mod, "API_KEY", "fake-key")
+
+        def respond(request, context):
+            year = requested_years(request)[0]
+            if year == 2020:
+                raise requests.exceptions.Timeout("Simulated timeout")
+            return {"results": [
+                make_api_result(192110, year),
+                make_api_result(164748, year),
+            ]}
+
+        requests_mock.get(mod.API, json=respond)
+        rows = mod.fetch_years([164748, 192110], [2019, 2020, 2021])
+
+        assert [(row["unitid"], row["year"]) for row in rows] == [
+            (164748, 2019),
+            (164748, 2021),
+            (192110, 2019),
+            (192110, 2021),
+        ]
+
+    # Test 43 (Error path): Client errors fail fast instead of retrying per year
+    def test_does_not_fall_back_on_client_errors(self, monkeypatch, requests_mock):
+        monkeypatch.setattr(mod, "API_KEY", "fake-key")
+
+        for status_code in (403, 429):
+            requests_mock.reset_mock()
+            requests_mock.get(mod.API, status_code=status_code)
+            rows = mod.fetch_rows([164748], [2019, 2020, 2021])
+
+            assert rows == []
+            assert requests_mock.call_count == 1
+
+    # Test 44 (Error path): Server errors still fall back to per-year requests
+    def test_falls_back_on_server_errors(self, monkeypatch, requests_mock):
+        monkeypatch.setattr(mod, "API_KEY", "fake-key")
+
+        requests_mock.get(mod.API, status_code=503)
+        rows = mod.fetch_rows([164748], [2019, 2020, 2021])
+
+        assert rows == []
+        assert requests_mock.call_count == 4  # 1 combined + 3 per year
+
+
+# =============================================================================
+# Tests for normalize_row_percentages()
+# =============================================================================
+
+
+class TestNormalizeRowPercentages:
+
+    # Test 45 (Happy path): Converts decimals to rounded percentages in place
+    def test_converts_decimals_in_place(self):
+        rows = [
+            {"admission_rate": 0.12344, "retention_rate_ft": 0.9, "grad_rate_150": 1.0},
+        ]
+
+        mod.normalize_row_percentages(rows)
+
+        assert rows[0] == {
+            "admission_rate": 12.34,
+            "retention_rate_ft": 90.0,
+            "grad_rate_150": 100.0,
+        }
+
+    # Test 46 (Edge case): Leaves None alone and only rounds percentages
+    def test_handles_none_and_percentage_values(self):
+        rows = [
+            {"admission_rate": None, "retention_rate_ft": 50.123, "grad_rate_150": -1.0},
+        ]
+
+        mod.normalize_row_percentages(rows)
+
+        assert rows[0]["admission_rate"] is None
+        assert rows[0]["retention_rate_ft"] == 50.12
+        assert rows[0]["grad_rate_150"] == -1.0
+
+    # Test 47 (Edge case): Non-numeric values become None, numeric strings are converted
+    def test_coerces_string_values(self):
+        rows = [
+            {"admission_rate": "bad", "retention_rate_ft": "0.5", "grad_rate_150": "PrivacySuppressed"},
+        ]
+
+        mod.normalize_row_percentages(rows)
+
+        assert rows[0] == {
+            "admission_rate": None,
+            "retention_rate_ft": 50.0,
+            "grad_rate_150": None,
+        }
+
+
+# =============================================================================
+# Tests for coerce_row_metrics()
+# =============================================================================
+
+
+class TestCoerceRowMetrics:
+
+    # Test 48 (Edge case): Matches the coercion applied by rows_to_frame
+    def test_matches_dataframe_coercion(self):
+        row = {"institution": "Berklee College of Music", "unitid": 164748, "year": 2020}
+        row.update(dict.fromkeys(mod.FIELD_MAP, 1.0))
+        row.update({
+            "enrollment_total": 1234.6,
+            "admission_rate": "PrivacySuppressed",
+            "tuition_fees": "50000",
+            "avg_net_price": None,
+        })
+        rows = [row]
+
+        df = mod.rows_to_frame([dict(row)])
+        mod.coerce_row_metrics(rows)
+
+        assert rows[0]["enrollment_total"] == 1235 == df["enrollment_total"].iloc[0]
+        assert rows[0]["admission_rate"] is None
+        assert pd.isna(df["admission_rate"].iloc[0])
+        assert rows[0]["tuition_fees"] == 50000.0 == df["tuition_fees"].iloc[0]
+        assert rows[0]["avg_net_price"] is None
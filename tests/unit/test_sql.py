@@ -22,13 +22,35 @@ import api_to_sql as mod
 # =============================================================================
 
 
+# Schema built once per session; tests get copies, never this connection
+@pytest.fixture(scope="session")
+def template_db():
+    conn = mod.create_database(":memory:")
+    yield conn
+    conn.close()
+
 # Create an in-memory database with schema for testing
+# Copied page-for-page from the template instead of re-running the DDL
 @pytest.fixture
-def in_memory_db():
-    conn = mod.create_database(":memory:")
+def in_memory_db(template_db):
+    conn = sqlite3.connect(":memory:")
+    template_db.backup(conn)
     yield conn
     conn.close()
 
+# sqlite_master names by type and table columns, read once from the template
+@pytest.fixture(scope="session")
+def schema_snapshot(template_db):
+    objects = {}
+    for obj_type, name in template_db.execute("SELECT type, name FROM sqlite_master"):
+        objects.setdefault(obj_type, set()).add(name)
+
+    columns = {
+        table: {row[1] for row in template_db.execute(f"PRAGMA table_info({table})")}
+        for table in ("schools", "school_metrics")
+    }
+    return {"objects": objects, "columns": columns}
+
 # Database with schools already inserted
 @pytest.fixture
 def db_with_schools(in_memory_db):
@@ -104,69 +126,39 @@ class TestBuildDbFilename:
 class TestCreateDatabase:
 
     # Test 5 (Happy path): Creates the schools table with correct schema
-    def test_creates_schools_table(self, in_memory_db):
-        cursor = in_memory_db.cursor()
-        cursor.execute("""
-            SELECT name FROM sqlite_master 
-            WHERE type='table' AND name='schools'
-        """)
-        result = cursor.fetchone()
-
-        assert result is not None
-        assert result[0] == "schools"
+    def test_creates_schools_table(self, schema_snapshot):
+        assert "schools" in schema_snapshot["objects"]["table"]
 
     # Test 6 (Happy path): Creates the school_metrics table
-    def test_creates_school_metrics_table(self, in_memory_db):
-        cursor = in_memory_db.cursor()
-        cursor.execute("""
-            SELECT name FROM sqlite_master 
-            WHERE type = 'table' AND name = 'school_metrics'
-        """)
-        result = cursor.fetchone()
-
-        assert result is not None
-        assert result[0] == "school_metrics"
+    def test_creates_school_metrics_table(self, schema_snapshot):
+        assert "school_metrics" in schema_snapshot["objects"]["table"]
 
     # Test 7 (Happy path): Creates the expected indexes
-    def test_creates_indexes(self, in_memory_db):
-        cursor = in_memory_db.cursor()
-        cursor.execute("""
-            SELECT name FROM sqlite_master 
-            WHERE type='index'
-        """)
-        indexes = [row[0] for row in cursor.fetchall()]
+    def test_creates_indexes(self, schema_snapshot):
+        indexes = schema_snapshot["objects"]["index"]
 
         assert "idx_metrics_year" in indexes
         assert "idx_metrics_school" in indexes
 
     # Test 8 (Happy path): Creates the expected views
-    def test_creates_views(self, in_memory_db):
-        cursor = in_memory_db.cursor()
-        cursor.execute("""
-            SELECT name FROM sqlite_master 
-            WHERE type = 'view'
-        """)
-        views = [row[0] for row in cursor.fetchall()]
+    def test_creates_views(self, schema_snapshot):
+        views = schema_snapshot["objects"]["view"]
 
         assert "v_school_metrics" in views
         assert "v_metrics_yoy" in views
         assert "v_school_summary" in views
 
     # Test 9 (Happy path): schools table has the expected columns
-    def test_schools_table_has_correct_columns(self, in_memory_db):
-        cursor = in_memory_db.cursor()
-        cursor.execute("PRAGMA table_info(schools)")
-        columns = {row[1] for row in cursor.fetchall()}
+    def test_schools_table_has_correct_columns(self, schema_snapshot):
+        columns = schema_snapshot["columns"]["schools"]
 
         assert "school_id" in columns
         assert "unitid" in columns
         assert "institution_name" in columns
 
     # Test 10 (Happy path): School_metrics table has the expected columns
-    def test_school_metrics_table_has_correct_columns(self, in_memory_db):
-        cursor = in_memory_db.cursor()
-        cursor.execute("PRAGMA table_info(school_metrics)")
-        columns = {row[1] for row in cursor.fetchall()}
+    def test_school_metrics_table_has_correct_columns(self, schema_snapshot):
+        columns = schema_snapshot["columns"]["school_metrics"]
 
         expected = {
             "school_id", "year", "enrollment_total", "admission_rate",
@@ -174,6 +166,19 @@ class TestCreateDatabase:
         }
         assert expected.issubset(columns)
 
+    # Test 11 (Edge case): Indexes can be deferred and built after loading
+    def test_defers_indexes(self):
+        conn = mod.create_database(":memory:", indexes=False)
+        query = "SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'idx_%'"
+
+        assert conn.execute(query).fetchall() == []
+
+        mod.create_indexes(conn)
+        indexes = {row[0] for row in conn.execute(query)}
+        conn.close()
+
+        assert indexes == {"idx_metrics_year", "idx_metrics_school"}
+
 
 # =============================================================================
 # Tests for insert_schools()
@@ -182,7 +187,7 @@ class TestCreateDatabase:
 
 class TestInsertSchools:
 
-    # Test 11 (Happy path): Inserts all schools from NAME_MAP
+    # Test 12 (Happy path): Inserts all schools from NAME_MAP
     def test_inserts_all_schools_from_name_map(self, in_memory_db):
         mod.insert_schools(in_memory_db)
 
@@ -192,7 +197,7 @@ class TestInsertSchools:
 
         assert count == len(mod.NAME_MAP)
 
-    # Test 12 (Happy path): Inserts the correct unitids
+    # Test 13 (Happy path): Inserts the correct unitids
     def test_inserts_correct_unitids(self, in_memory_db):
         mod.insert_schools(in_memory_db)
 
@@ -202,7 +207,7 @@ class TestInsertSchools:
 
         assert unitids == set(mod.NAME_MAP.keys())
 
-    # Test 13 (Happy path): Inserts the correct institution names
+    # Test 14 (Happy path): Inserts the correct institution names
     def test_inserts_correct_institution_names(self, in_memory_db):
         mod.insert_schools(in_memory_db)
 
@@ -213,7 +218,7 @@ class TestInsertSchools:
         for unitid, name in rows:
             assert mod.NAME_MAP[unitid] == name
 
-    # Test 14 (Edge case): Can be called multiple times without duplicating data
+    # Test 15 (Edge case): Can be called multiple times without duplicating data
     def test_is_idempotent(self, in_memory_db):
         mod.insert_schools(in_memory_db)
         mod.insert_schools(in_memory_db)  # Call again
@@ -224,6 +229,20 @@ class TestInsertSchools:
 
         assert count == len(mod.NAME_MAP)
 
+    # Test 16 (Edge case): Commits its own transaction
+    def test_commits_inserted_schools(self, tmp_path):
+        db_path = tmp_path / "schools.db"
+        conn = mod.create_database(db_path)
+        mod.insert_schools(conn)
+        assert not conn.in_transaction
+        conn.close()
+
+        conn = sqlite3.connect(db_path)
+        count = conn.execute("SELECT COUNT(*) FROM schools").fetchone()[0]
+        conn.close()
+
+        assert count == len(mod.NAME_MAP)
+
 
 # =============================================================================
 # Tests for get_school_id()
@@ -232,7 +251,7 @@ class TestInsertSchools:
 
 class TestGetSchoolId:
 
-    # Test 15 (Happy path): Returns the correct school_id for a known unitid
+    # Test 17 (Happy path): Returns the correct school_id for a known unitid
     def test_returns_correct_school_id(self, db_with_schools):
         # Get Berklee's school_id
         school_id = mod.get_school_id(db_with_schools, 164748)
@@ -240,19 +259,27 @@ class TestGetSchoolId:
         assert school_id is not None
         assert isinstance(school_id, int)
 
-    # Test 16 (Edge case): Returns None for an unknown unitid
+    # Test 18 (Edge case): Returns None for an unknown unitid
     def test_returns_none_for_unknown_unitid(self, db_with_schools):
         school_id = mod.get_school_id(db_with_schools, 999999)
 
         assert school_id is None
 
-    # Test 17 (Happy path): Different schools have different IDs
+    # Test 19 (Happy path): Different schools have different IDs
     def test_returns_different_ids_for_different_schools(self, db_with_schools):
         berklee_id = mod.get_school_id(db_with_schools, 164748)
         juilliard_id = mod.get_school_id(db_with_schools, 192110)
 
         assert berklee_id != juilliard_id
 
+    # Test 20 (Happy path): get_school_ids maps every school in one query
+    def test_get_school_ids_matches_single_lookups(self, db_with_schools):
+        school_ids = mod.get_school_ids(db_with_schools)
+
+        assert set(school_ids) == set(mod.NAME_MAP)
+        for unitid, school_id in school_ids.items():
+            assert mod.get_school_id(db_with_schools, unitid) == school_id
+
 
 # =============================================================================
 # Tests for insert_metrics()
@@ -261,7 +288,7 @@ class TestGetSchoolId:
 
 class TestInsertMetrics:
 
-    # Test 18 (Happy path): Inserts data into school_metrics table
+    # Test 21 (Happy path): Inserts data into school_metrics table
     def test_inserts_metrics_data(self, db_with_schools):
         df = pd.DataFrame({
             "institution": ["Berklee College of Music"],
@@ -283,7 +310,7 @@ class TestInsertMetrics:
 
         assert count == 1
 
-    # Test 19 (Happy path): Inserts the correct metric values
+    # Test 22 (Happy path): Inserts the correct metric values
     def test_inserts_correct_values(self, db_with_schools):
         df = pd.DataFrame({
             "institution": ["Berklee College of Music"],
@@ -310,7 +337,7 @@ class TestInsertMetrics:
         assert row[1] == 42.0
         assert row[2] == 50000
 
-    # Test 20 (Happy path): Can insert data for multiple years
+    # Test 23 (Happy path): Can insert data for multiple years
     def test_handles_multiple_years(self, db_with_schools):
         df = pd.DataFrame({
             "institution": ["Berklee College of Music", "Berklee College of Music"],
@@ -332,7 +359,7 @@ class TestInsertMetrics:
 
         assert count == 2
 
-    # Test 21 (Edge case): Can insert data for multiple schools
+    # Test 24 (Edge case): Can insert data for multiple schools
     def test_handles_multiple_schools(self, db_with_schools):
         df = pd.DataFrame({
             "institution": ["Berklee College of Music", "The Juilliard School"],
@@ -354,7 +381,7 @@ class TestInsertMetrics:
 
         assert count == 2
 
-    # Test 22 (Edge case): Skips rows with unitids not in the schools table
+    # Test 25 (Edge case): Skips rows with unitids not in the schools table
     def test_skips_unknown_unitids(self, db_with_schools):
         df = pd.DataFrame({
             "institution": ["Unknown School", "Berklee College of Music"],
@@ -377,7 +404,7 @@ class TestInsertMetrics:
         # Only Berklee should be inserted
         assert count == 1
 
-    # Test 23 (Edge case): Updates existing rows on duplicate (school_id, year)
+    # Test 26 (Edge case): Updates existing rows on duplicate (school_id, year)
     def test_upserts_on_duplicate_key(self, db_with_schools):
         df1 = pd.DataFrame({
             "institution": ["Berklee College of Music"],
@@ -419,6 +446,48 @@ class TestInsertMetrics:
         assert row[0] == 1100  # Updated value
         assert row[1] == 52.0  # Updated value
 
+    # Test 27 (Edge case): Missing values in typed columns are stored as NULL
+    def test_stores_missing_typed_values_as_null(self, db_with_schools):
+        df = pd.DataFrame({
+            "institution": ["Berklee College of Music"],
+            "unitid": [164748],
+            "year": [2020],
+            "enrollment_total": [None],
+            "admission_rate": [None],
+            "retention_rate_ft": [90.0],
+            "grad_rate_150": [75.0],
+            "tuition_fees": [50000],
+            "avg_net_price": [30000],
+        }).astype(mod.DTYPES)  # enrollment_total holds pd.NA
+
+        mod.insert_metrics(db_with_schools, df)
+
+        cursor = db_with_schools.cursor()
+        cursor.execute("SELECT enrollment_total, admission_rate FROM school_metrics")
+        assert cursor.fetchone() == (None, None)
+
+    # Test 28 (Error path): A failed insert rolls back the batch but keeps the schools
+    def test_failed_insert_rolls_back_only_metrics(self, db_with_schools):
+        df = pd.DataFrame({
+            "institution": ["Berklee College of Music"] * 2,
+            "unitid": [164748, 164748],
+            "year": [2020, 2021],
+            "enrollment_total": [1000, 1100],
+            "admission_rate": [50.0, 52.0],
+            "retention_rate_ft": [90.0, 91.0],
+            "grad_rate_150": [75.0, 76.0],
+            "tuition_fees": [50000, {"bad": "value"}],  # Can't be bound
+            "avg_net_price": [30000, 31000],
+        })
+
+        assert mod.insert_metrics(db_with_schools, df) is False
+
+        cursor = db_with_schools.cursor()
+        cursor.execute("SELECT COUNT(*) FROM school_metrics")
+        assert cursor.fetchone()[0] == 0
+        cursor.execute("SELECT COUNT(*) FROM schools")
+        assert cursor.fetchone()[0] == len(mod.NAME_MAP)
+
 
 # =============================================================================
 # Tests for views
@@ -427,7 +496,7 @@ class TestInsertMetrics:
 
 class TestViews:
 
-    # Test 24 (Happy path): v_school_metrics view correctly joins schools and metrics
+    # Test 29 (Happy path): v_school_metrics view correctly joins schools and metrics
     def test_v_school_metrics_joins_correctly(self, db_with_schools):
         df = pd.DataFrame({
             "institution": ["Berklee College of Music"],
@@ -450,7 +519,7 @@ class TestViews:
         assert row[1] == 2020
         assert row[2] == 1000
 
-    # Test 25 (Happy path): v_school_summary view correctly calculates summary statistics
+    # Test 30 (Happy path): v_school_summary view correctly calculates summary statistics
     def test_v_school_summary_calculates_averages(self, db_with_schools):
         df = pd.DataFrame({
             "institution": ["Berklee College of Music", "Berklee College of Music"],
@@ -477,3 +546,75 @@ class TestViews:
         assert row[1] == 2  # years_of_data
         assert row[2] == 1000  # avg_enrollment (900 + 1100) / 2
         assert row[3] == 50.0  # avg_admission_rate (48 + 52) / 2
+
+    # Test 31 (Edge case): v_school_summary reflects every insert, including upserts
+    def test_v_school_summary_reflects_latest_insert(self, db_with_schools):
+        query = "SELECT years_of_data, avg_enrollment FROM v_school_summary WHERE unitid = 164748"
+
+        # Schools without metrics are listed with no data
+        assert db_with_schools.execute(query).fetchone() == (0, None)
+
+        for enrollment in (1000, 1200):
+            df = pd.DataFrame({
+                "institution": ["Berklee College of Music"],
+                "unitid": [164748],
+                "year": [2020],
+                "enrollment_total": [enrollment],
+                "admission_rate": [50.0],
+                "retention_rate_ft": [90.0],
+                "grad_rate_150": [75.0],
+                "tuition_fees": [50000],
+                "avg_net_price": [30000],
+            })
+            mod.insert_metrics(db_with_schools, df)
+
+        assert db_with_schools.execute(query).fetchone() == (1, 1200)
+
+    # Test 32 (Edge case): v_school_summary follows direct SQL updates and deletes
+    def test_v_school_summary_tracks_direct_writes(self, db_with_schools):
+        df = pd.DataFrame({
+            "institution": ["Berklee College of Music", "Berklee College of Music"],
+            "unitid": [164748, 164748],
+            "year": [2019, 2020],
+            "enrollment_total": [900, 1100],
+            "admission_rate": [48.0, 52.0],
+            "retention_rate_ft": [88.0, 92.0],
+            "grad_rate_150": [70.0, 80.0],
+            "tuition_fees": [48000, 52000],
+            "avg_net_price": [28000, 32000],
+        })
+        mod.insert_metrics(db_with_schools, df)
+
+        query = "SELECT years_of_data, avg_enrollment FROM v_school_summary WHERE unitid = 164748"
+        with db_with_schools:
+            db_with_schools.execute("UPDATE school_metrics SET enrollment_total = 1300 WHERE year = 2019")
+        assert db_with_schools.execute(query).fetchone() == (2, 1200)
+
+        with db_with_schools:
+            db_with_schools.execute("DELETE FROM school_metrics")
+        assert db_with_schools.execute(query).fetchone() == (0, None)
+
+        with db_with_schools:
+            db_with_schools.execute("DELETE FROM schools WHERE unitid = 164748")
+        assert db_with_schools.execute(query).fetchone() is None
+
+    # Test 33 (Edge case): v_school_summary lists schools in school_id order
+    def test_v_school_summary_keeps_school_order(self, db_with_schools):
+        df = pd.DataFrame({
+            "institution": ["New England Conservatory"],
+            "unitid": [167057],
+            "year": [2020],
+            "enrollment_total": [800],
+            "admission_rate": [30.0],
+            "retention_rate_ft": [90.0],
+            "grad_rate_150": [75.0],
+            "tuition_fees": [50000],
+            "avg_net_price": [30000],
+        })
+        mod.insert_metrics(db_with_schools, df)  # Rebuilds one school's row
+
+        cursor = db_with_schools.cursor()
+        cursor.execute("SELECT unitid FROM v_school_summary")
+        unitids = [row[0] for row in cursor.fetchall()]
+
+        assert unitids == list(mod.NAME_MAP)